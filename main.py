@@ -1,35 +1,86 @@
 import os
 
-from fastapi import FastAPI, Depends, Path, Query, Body
+from fastapi import FastAPI, Depends, Path, Query, Body, Header, HTTPException
 from fastapi.logger import logger
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.responses import StreamingResponse
-from fastapi.responses import FileResponse
-from typing import List
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from fastapi.responses import FileResponse, ORJSONResponse, Response, StreamingResponse
+from typing import List, Optional
 from bson.json_util import dumps, loads
+from email.utils import formatdate, parsedate_to_datetime
 from zipfile import ZipFile
+import gzip
+import hashlib
+import io
 import pathlib
 import json
+import re
+import anyio
+import orjson
 from fuse.models.Objects import Passports, ProviderExampleObject, ExampleMetadata
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
-origins = [
-    f"http://{os.getenv('HOSTNAME')}:{os.getenv('HOSTPORT')}",
-    f"http://{os.getenv('HOSTNAME')}",
-    "http://localhost:{os.getenv('HOSTPORT')}",
-    "http://localhost",
-    "*",
-]
+# docker-compose mounts config/service_info.json next to main.py; fall back to the
+# copy in config/ when running straight from a checkout
+_SERVICE_INFO_PATH = pathlib.Path(__file__).parent / "service_info.json"
+if not _SERVICE_INFO_PATH.exists():
+    _SERVICE_INFO_PATH = pathlib.Path(__file__).parent / "config" / "service_info.json"
+
+# service_info.json is read-only for the life of the process, so serialize it once
+# here instead of on every /service-info request
+with open(_SERVICE_INFO_PATH) as f:
+    _SERVICE_INFO_BODY = orjson.dumps(json.load(f))
+
+EXAMPLES_DIR = pathlib.Path(__file__).resolve().parent / "examples"
+EXAMPLES_ZIP_PATH = pathlib.Path(__file__).resolve().parent / "exampleszip.zip"
 
+# the only object_ids /files will serve
+_EXAMPLE_IDS = frozenset({"HPA.csv", "TestPhenotypes_3.csv", "exampleszip.zip"})
+
+# access URLs handed out by objects() and get_objects() differ only by object_id
+_FILES_URL_PREFIX = "http://localhost:8083/files/"
+
+# every origin is allowed, so skip the per-request origin matching; credentials
+# can't be combined with a wildcard origin anyway
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
+    allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
+class ExampleGZipMiddleware(GZipMiddleware):
+    # byte ranges refer to the unencoded file, so never gzip a ranged request, and
+    # don't let a gzipped body claim range support or the identity file's ETag
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and "range" in Headers(scope=scope):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_encoded(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                if headers.get("content-encoding") == "gzip":
+                    if "accept-ranges" in headers:
+                        del headers["accept-ranges"]
+                    etag = headers.get("etag")
+                    if etag is not None and not etag.startswith("W/"):
+                        headers["etag"] = 'W/"%s"' % etag.strip('"')
+            await send(message)
+
+        await super().__call__(scope, receive, send_encoded)
+
+# smaller bodies aren't worth the gzip framing
+_GZIP_MINIMUM_SIZE = 1024
+
+# the DRS metadata is plain text and compresses well; level 5 keeps nearly all of
+# level 9's ratio at half the CPU. /files downloads are precompressed at startup,
+# and the middleware passes their Content-Encoding: gzip responses through
+app.add_middleware(ExampleGZipMiddleware, minimum_size=_GZIP_MINIMUM_SIZE, compresslevel=5)
+
 
 
     
@@ -59,32 +110,37 @@ async def service_info():
     ```
     See the Service Registry Appendix for more information on how to register a DRS service with a service registry.
     '''
-    service_info_path = pathlib.Path(__file__).parent / "service_info.json"
-    with open(service_info_path) as f:
-        return json.load(f)
+    return Response(content=_SERVICE_INFO_BODY, media_type="application/json")
 
     
+# ExampleMetadata never changes between requests, so render it once; objects()
+# only swaps in the per-object access_methods and contents
+_EXAMPLE_METADATA = ExampleMetadata().model_dump()
+_EXAMPLE_ZIP_CONTENTS = [
+    {
+        "name": "HPA.csv",
+        "id": "HPA.csv",
+        "drs_uri": "drs://drs.example.org/314159",
+    },
+    {
+        "name": "TestPhenotypes_3.csv",
+        "id": "TestPhenotypes_3.csv",
+        "drs_uri": "drs://drs.example.org/314159",
+    }
+]
+
 # READ-ONLY endpoints follow the GA4GH DRS API, modeled below
 # https://editor.swagger.io/?url=https://ga4gh.github.io/data-repository-service-schemas/preview/release/drs-1.2.0/openapi.yaml
     
-@app.get("/objects/{object_id}", summary="Get info about a DrsObject.")
-async def objects(object_id: str = Path(default="", description="DrsObject identifier"),
+@app.get("/objects/{object_id}", summary="Get info about a DrsObject.", response_model=None,
+         responses={200: {"model": ExampleMetadata}})
+async def objects(object_id: str = Path(description="DrsObject identifier"),
                   expand: bool = Query(default=False, description="If false and the object_id refers to a bundle, then the ContentsObject array contains only those objects directly contained in the bundle. That is, if the bundle contains other bundles, those other bundles are not recursively included in the result. If true and the object_id refers to a bundle, then the entire set of objects in the bundle is expanded. That is, if the bundle contains aother bundles, then those other bundles are recursively expanded and included in the result. Recursion continues through the entire sub-tree of the bundle. If the object_id refers to a blob, then the query parameter is ignored.")):
     '''
     Returns object metadata, and a list of access methods that can be used to fetch object bytes.
     '''
-    example_object = ExampleMetadata()
-    example_object.access_methods = [
-        {
-            "type": "GET",
-            "access_url": {
-                "url": "http://localhost:8083/files/" + object_id
-            },
-        }
-    ]
-
     if not object_id == "exampleszip.zip":
-        example_object.contents =  [
+        contents = [
             {
                 "name": object_id,
                 "id": object_id,
@@ -92,23 +148,25 @@ async def objects(object_id: str = Path(default="", description="DrsObject ident
             }
         ]
     else:
-        example_object.contents =  [
-            {
-                "name": "HPA.csv",
-                "id": "HPA.csv",
-                "drs_uri": "drs://drs.example.org/314159",
-            },
+        contents = _EXAMPLE_ZIP_CONTENTS
+
+    # the payload is built from trusted constants, so hand it straight to orjson;
+    # ExampleMetadata in the route only documents the schema in OpenAPI
+    return ORJSONResponse({
+        **_EXAMPLE_METADATA,
+        "access_methods": [
             {
-                "name": "TestPhenotypes_3.csv",
-                "id": "TestPhenotypes_3.csv",
-                "drs_uri": "drs://drs.example.org/314159",
+                "type": "GET",
+                "access_url": {
+                    "url": _FILES_URL_PREFIX + object_id
+                },
             }
-        ]
-
-    return example_object.dict()
+        ],
+        "contents": contents,
+    })
 
 # @app.get("/files/{file_name}", summary="Get file.")
-# async def files(file_name: str = Path(default="", description="File name")):
+# async def files(file_name: str = Path(description="File name")):
 #     '''
 #     Returns file metadata, and a list of access methods that can be used to fetch the file.
 #     :param file_name:
@@ -134,7 +192,7 @@ async def objects(object_id: str = Path(default="", description="DrsObject ident
 # xxx figure out how to add the following description to 'passports':
 # the encoded JWT GA4GH Passport that contains embedded Visas. The overall JWT is signed as are the individual Passport Visas
 @app.post("/objects/{object_id}", summary="Get info about a DrsObject through POST'ing a Passport.")
-async def post_objects(object_id: str = Path(default="", description="DrsObject identifier"),
+async def post_objects(object_id: str = Path(description="DrsObject identifier"),
                        expand: bool = Query(default=False, description="If false and the object_id refers to a bundle, then the ContentsObject array contains only those objects directly contained in the bundle. That is, if the bundle contains other bundles, those other bundles are not recursively included in the result. If true and the object_id refers to a bundle, then the entire set of objects in the bundle is expanded. That is, if the bundle contains aother bundles, then those other bundles are recursively expanded and included in the result. Recursion continues through the entire sub-tree of the bundle. If the object_id refers to a blob, then the query parameter is ignored."),
                        passports: Passports = Depends(Passports.as_form)):
     '''
@@ -143,11 +201,11 @@ async def post_objects(object_id: str = Path(default="", description="DrsObject
     GA4GH Passport sent in the formData in order to authorize access.
     '''
     example_object = ProviderExampleObject()
-    return example_object.dict()
+    return example_object
 
 @app.get("/objects/{object_id}/access/{access_id}", summary="Get a URL for fetching bytes")
-async def get_objects(object_id: str=Path(default="", description="DrsObject identifier"),
-                      access_id: str=Path(default="", description="An access_id from the access_methods list of a DrsObject")):
+async def get_objects(object_id: str=Path(description="DrsObject identifier"),
+                      access_id: str=Path(description="An access_id from the access_methods list of a DrsObject")):
     '''
     Returns a URL that can be used to fetch the bytes of a
     DrsObject. This method only needs to be called when using an
@@ -156,50 +214,183 @@ async def get_objects(object_id: str=Path(default="", description="DrsObject ide
     '''
 
 
-    return {
-        "url": "http://localhost:8083/files/" + object_id,
+    # returning the response directly skips FastAPI's jsonable_encoder pass
+    return ORJSONResponse({
+        "url": _FILES_URL_PREFIX + object_id,
         "headers": "Authorization: None"
-    }
+    })
 
-@app.get("/files/{object_id}", summary="Get a URL for fetching bytes")
-async def get_examples(object_id: str):
-    examples_zip_path = pathlib.Path('exampleszip')
-    if not examples_zip_path.exists():
-        # print("generating zip")
-        local_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "examples")
-        ezip = ZipFile('exampleszip', 'w')
-        ezip.write((os.path.join(local_path, f"HPA.csv")), 'HPA.csv')
-        ezip.write(os.path.join(local_path, f"TestPhenotypes_3.csv"), 'TestPhenotypes_3.csv')
-        # ezip.printdir()
-        ezip.close()
-
-    if not (object_id == 'exampleszip.zip'):
-        dir_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "examples")
-        local_path = os.path.join(dir_path, object_id)
-        file_type = "text/csv"
-    else:
-        local_path = object_id
-        file_type = "application/zip"
+# absolute path and media type of each servable example, keyed by object_id; an
+# object_id missing from _EXAMPLE_PATHS is rejected before touching the filesystem
+_EXAMPLE_PATHS = {name: str(EXAMPLES_DIR / name) for name in _EXAMPLE_IDS}
+_EXAMPLE_PATHS["exampleszip.zip"] = str(EXAMPLES_ZIP_PATH)
+_EXAMPLE_MEDIA_TYPES = {name: "text/csv" for name in _EXAMPLE_IDS}
+_EXAMPLE_MEDIA_TYPES["exampleszip.zip"] = "application/zip"
+
+# os.stat() and (ETag, Last-Modified) of each servable example, keyed by
+# object_id; filled in at startup
+_EXAMPLE_STATS = {}
+_EXAMPLE_VALIDATORS = {}
+# gzip-encoded body of each example large enough to be worth it; filled in at startup
+_EXAMPLE_GZIP = {}
 
-    def iterfile():
+def _stat_validators(stat_result):
+    # the same mtime-size digest FileResponse uses, but quoted as RFC 7232 requires;
+    # passing these explicitly keeps full and partial responses in agreement
+    etag_base = str(stat_result.st_mtime) + "-" + str(stat_result.st_size)
+    etag = '"%s"' % hashlib.md5(etag_base.encode()).hexdigest()
+    return etag, formatdate(stat_result.st_mtime, usegmt=True)
+
+def _gzip_file(path):
+    # mtime=0 keeps the encoded bytes identical across workers and restarts;
+    # gzip.compress() only takes mtime from Python 3.8
+    buf = io.BytesIO()
+    with open(path, "rb") as f, gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=9, mtime=0) as gz:
+        gz.write(f.read())
+    return buf.getvalue()
+
+def _build_examples_zip():
+    if not EXAMPLES_ZIP_PATH.exists():
+        # every uvicorn worker runs this at startup, so build under a per-process
+        # name and hard-link it into place. os.link() never replaces an existing
+        # zip: the first worker's copy wins and every worker stats that same file,
+        # so they all hand out the same ETag/Last-Modified
+        tmp_path = EXAMPLES_ZIP_PATH.with_name(f"{EXAMPLES_ZIP_PATH.name}.{os.getpid()}")
+        with ZipFile(tmp_path, 'w') as ezip:
+            ezip.write(_EXAMPLE_PATHS["HPA.csv"], 'HPA.csv')
+            ezip.write(_EXAMPLE_PATHS["TestPhenotypes_3.csv"], 'TestPhenotypes_3.csv')
         try:
-            with open(local_path, mode="rb") as file_data:
-                yield from file_data
-        except:
-            raise Exception()
+            os.link(tmp_path, EXAMPLES_ZIP_PATH)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
+
+    for name, path in _EXAMPLE_PATHS.items():
+        _EXAMPLE_STATS[name] = os.stat(path)
+        _EXAMPLE_VALIDATORS[name] = _stat_validators(_EXAMPLE_STATS[name])
+        if _EXAMPLE_STATS[name].st_size >= _GZIP_MINIMUM_SIZE:
+            _EXAMPLE_GZIP[name] = _gzip_file(path)
 
+@app.on_event("startup")
+async def _build_zip():
+    # build the zip and gzip the examples once, off the event loop, so /files
+    # never blocks on ZipFile or compression
+    await run_in_threadpool(_build_examples_zip)
 
+def _parse_byte_range(range_header, size):
+    '''
+    Returns the inclusive (start, end) of a single "bytes=" range, or None if the
+    header should be ignored and the whole file sent (another unit, several
+    ranges, or bad syntax). Raises a 416 if the range starts past the end.
+    '''
+    unit, _, spec = range_header.partition("=")
+    # ASCII digits only: headers arrive as Latin-1, and int() would accept "²"
+    match = re.fullmatch(r"(\d*)-(\d*)", spec.strip(), re.ASCII)
+    if unit.strip().lower() != "bytes" or match is None:
+        return None
+    first, last = match.groups()
+    if not (first or last):
+        return None
+
+    if first:
+        start = int(first)
+        end = int(last) if last else size - 1
+        if last and end < start:
+            return None
+    else:
+        # suffix range: the last N bytes
+        start = max(size - int(last), 0)
+        end = size - 1
 
-    response = StreamingResponse(iterfile(), media_type=file_type)
-    response.headers["Content-Disposition"] = "attachment; filename=examples"
-    return response
+    if start >= size:
+        raise HTTPException(status_code=416, detail="Range not satisfiable",
+                            headers={"Content-Range": f"bytes */{size}"})
+    return start, min(end, size - 1)
 
+def _if_range_matches(if_range, etag, last_modified):
+    '''
+    True if an If-Range validator names the version being served: a strong
+    entity-tag must equal the ETag, a date must equal Last-Modified.
+    '''
+    if if_range.startswith('"'):
+        return if_range == etag
+    if if_range.startswith("W/"):
+        return False
+    try:
+        return parsedate_to_datetime(if_range) == parsedate_to_datetime(last_modified)
+    except (TypeError, ValueError):
+        return False
+
+async def _iter_byte_range(path, start, length):
+    async with await anyio.open_file(path, mode="rb") as f:
+        await f.seek(start)
+        while length > 0:
+            chunk = await f.read(min(FileResponse.chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+@app.get("/files/{object_id}", summary="Get a URL for fetching bytes")
+async def get_examples(object_id: str,
+                       range_header: Optional[str] = Header(default=None, alias="Range"),
+                       if_range: Optional[str] = Header(default=None, alias="If-Range"),
+                       accept_encoding: str = Header(default="", alias="Accept-Encoding")):
+    local_path = _EXAMPLE_PATHS.get(object_id)
+    if local_path is None:
+        raise HTTPException(status_code=404, detail="Object not found")
+
+    media_type = _EXAMPLE_MEDIA_TYPES[object_id]
+    stat_result = _EXAMPLE_STATS.get(object_id)
+    headers = {"Accept-Ranges": "bytes"}
+    byte_range = None
+    if stat_result is not None:
+        etag, last_modified = _EXAMPLE_VALIDATORS[object_id]
+        headers.update({"ETag": etag, "Last-Modified": last_modified})
+        # a stale If-Range means the client holds pieces of another version, so
+        # ignore Range and send the whole file (RFC 7233 section 3.2)
+        if range_header is not None and (if_range is None or _if_range_matches(if_range, etag, last_modified)):
+            byte_range = _parse_byte_range(range_header, stat_result.st_size)
+
+    gzip_body = _EXAMPLE_GZIP.get(object_id)
+    if range_header is None and gzip_body is not None and "gzip" in accept_encoding:
+        # a different representation from the file on disk: no byte ranges, and
+        # only a weak ETag (see ExampleGZipMiddleware)
+        return Response(content=gzip_body, media_type=media_type, headers={
+            "Content-Encoding": "gzip",
+            "Vary": "Accept-Encoding",
+            "ETag": "W/" + etag,
+            "Last-Modified": last_modified,
+            "Content-Disposition": 'attachment; filename="examples"',
+        })
+
+    if byte_range is None:
+        return FileResponse(local_path, media_type=media_type, filename="examples",
+                            stat_result=stat_result, headers=headers)
+
+    start, end = byte_range
+    length = end - start + 1
+    return StreamingResponse(_iter_byte_range(local_path, start, length), status_code=206,
+                             media_type=media_type, headers={
+                                 **headers,
+                                 "Content-Range": f"bytes {start}-{end}/{stat_result.st_size}",
+                                 "Content-Length": str(length),
+                                 "Content-Disposition": 'attachment; filename="examples"',
+                             })
+
+
+# the POST access response doesn't depend on the request, so serialize it once
+_POST_ACCESS_BODY = orjson.dumps({
+    "url": "http://localhost/object.zip",
+    "headers": "Authorization: None"
+})
 
 # xxx figure out how to add the following description to 'passports':
 # the encoded JWT GA4GH Passport that contains embedded Visas. The overall JWT is signed as are the individual Passport Visas.
 @app.post("/objects/{object_id}/access/{access_id}", summary="Get a URL for fetching bytes through POST'ing a Passport")
-async def post_objects(object_id: str=Path(default="", description="DrsObject identifier"),
-                       access_id: str=Path(default="", description="An access_id from the access_methods list of a DrsObject"),
+async def post_objects(object_id: str=Path(description="DrsObject identifier"),
+                       access_id: str=Path(description="An access_id from the access_methods list of a DrsObject"),
                        passports: Passports = Depends(Passports.as_form)):
     '''
     Returns a URL that can be used to fetch the bytes of a
@@ -210,8 +401,5 @@ async def post_objects(object_id: str=Path(default="", description="DrsObject id
     authorize access.
 
     '''
-    return {
-        "url": "http://localhost/object.zip",
-        "headers": "Authorization: None"
-    }
+    return Response(content=_POST_ACCESS_BODY, media_type="application/json")
 
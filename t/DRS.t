@@ -18,7 +18,7 @@ use warnings;
 
 use Getopt::Long qw(GetOptions);
 
-use Test::More tests => 5;
+use Test::More tests => 7;
 use Test::File::Contents;
 
 use lib './t';
@@ -64,4 +64,8 @@ $fn = "DRS-4.json";
 files_eq(f($fn), cmd("GET",$fn, "objects/{$OBJID}/access/{$ACCESSID}"),             "Get URL for fetching bytes");
 $fn = "DRS-5.json";
 files_eq(f($fn), cmd("GET",$fn, "objects/{$OBJID}/access/{$ACCESSID}", $PASSPORTS), "Get URL for fetching bytes through POST-ing a Passport");
+$fn = "DRS-6.json";
+files_eq(f($fn), cmd("GET",$fn, "files/nope.csv"),                                   "Reject an object_id that isn't a served example");
+$fn = "DRS-7.json";
+files_eq(f($fn), cmd("GET",$fn, "files/main.py"),                                    "Reject an object_id outside the examples whitelist");
 
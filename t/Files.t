@@ -0,0 +1,126 @@
+#
+#   prove -v t/Files.t [ :: [--verbose] [--dry_run] ]
+#
+# Assumes containers are built and running (use up.sh)
+#
+# Checks the HTTP Range handling on /files/{object_id}
+#
+# Dependencies:
+#   curl
+# To install:
+#   cpan App::cpanminus
+#   # restart shell, then get the dependencies:
+#   cpanm --installdeps .
+# For more details:
+#   http://www.cpan.org/modules/INSTALL.html
+
+use 5.16.3;
+use strict;
+use warnings;
+
+use Getopt::Long qw(GetOptions);
+
+use Test::More;
+
+use lib './t';
+use Support;
+
+our $verbose = 0;
+our $dry_run = 0;
+
+our $OBJID = "HPA.csv";
+our $SIZE = -s "examples/${OBJID}";
+
+
+# read the .env file
+use Dotenv;
+Dotenv->load;
+
+our $HOST_PATH = "http://localhost:$ENV{'API_PORT'}";
+
+
+GetOptions('dry_run' => \$dry_run,
+	   'verbose' => \$verbose) or die "Usage: prove -v t/$0 [ :: [--verbose] ] \n";
+if($verbose){
+    print("+ dry_run: $dry_run\n");
+    print("+ verbose: $verbose\n");
+    print("+ API_PORT: $ENV{'API_PORT'}\n");
+}
+plan skip_all => "no requests are sent in a dry run" if $dry_run;
+plan tests => 34;
+
+my $last = $SIZE - 1;
+my $resp;
+
+$resp = http_headers("files/${OBJID}");
+is($resp->{status}, 200,                                          "Full download");
+is($resp->{"accept-ranges"}, "bytes",                             "Full download advertises byte ranges");
+like($resp->{etag}, qr{^"[0-9a-f]+"$},                             "Full download has a strong ETag");
+my $etag = $resp->{etag};
+my $last_modified = $resp->{"last-modified"};
+
+$resp = http_headers("files/${OBJID}", "Range: bytes=0-9");
+is($resp->{status}, 206,                                          "Single range");
+is($resp->{"content-range"}, "bytes 0-9/${SIZE}",                 "Single range Content-Range");
+is($resp->{"content-length"}, 10,                                 "Single range Content-Length");
+
+$resp = http_headers("files/${OBJID}", "Range: bytes=10-");
+is($resp->{status}, 206,                                          "Open-ended range");
+is($resp->{"content-range"}, "bytes 10-${last}/${SIZE}",          "Open-ended range Content-Range");
+
+$resp = http_headers("files/${OBJID}", "Range: bytes=-5");
+is($resp->{status}, 206,                                          "Suffix range");
+is($resp->{"content-range"}, sprintf("bytes %d-%d/%d", $SIZE - 5, $last, $SIZE), "Suffix range Content-Range");
+
+$resp = http_headers("files/${OBJID}", "Range: bytes=0-99999999");
+is($resp->{status}, 206,                                          "Range past the end is clamped");
+is($resp->{"content-range"}, "bytes 0-${last}/${SIZE}",           "Clamped range Content-Range");
+
+$resp = http_headers("files/${OBJID}", "Range: bytes=0-9");
+is($resp->{etag}, $etag,                                          "Partial download has the full download's ETag");
+is($resp->{"last-modified"}, $last_modified,                      "Partial download has the full download's Last-Modified");
+
+$resp = http_headers("files/${OBJID}", "Range: bytes=0-9", "If-Range: ${etag}");
+is($resp->{status}, 206,                                          "If-Range with the current ETag");
+$resp = http_headers("files/${OBJID}", "Range: bytes=0-9", "If-Range: ${last_modified}");
+is($resp->{status}, 206,                                          "If-Range with the current Last-Modified");
+$resp = http_headers("files/${OBJID}", "Range: bytes=0-9", 'If-Range: "stale"');
+is($resp->{status}, 200,                                          "If-Range with another ETag sends the full file");
+ok(!exists $resp->{"content-range"},                              "If-Range with another ETag has no Content-Range");
+$resp = http_headers("files/${OBJID}", "Range: bytes=0-9", "If-Range: W/${etag}");
+is($resp->{status}, 200,                                          "If-Range with a weak ETag sends the full file");
+$resp = http_headers("files/${OBJID}", "Range: bytes=0-9", "If-Range: Thu, 01 Jan 1970 00:00:00 GMT");
+is($resp->{status}, 200,                                          "If-Range with another date sends the full file");
+
+$resp = http_headers("files/${OBJID}", "Range: bytes=${SIZE}-");
+is($resp->{status}, 416,                                          "Range starting past the end");
+is($resp->{"content-range"}, "bytes */${SIZE}",                   "Unsatisfiable range Content-Range");
+
+$resp = http_headers("files/${OBJID}", "Range: bytes=-0");
+is($resp->{status}, 416,                                          "Empty suffix range");
+
+$resp = http_headers("files/${OBJID}", "Range: bytes=0-1,3-4");
+is($resp->{status}, 200,                                          "Multiple ranges fall back to the full file");
+
+$resp = http_headers("files/${OBJID}", "Range: items=0-1");
+is($resp->{status}, 200,                                          "Other units fall back to the full file");
+
+$resp = http_headers("files/${OBJID}", "Range: bytes=5-1");
+is($resp->{status}, 200,                                          "Reversed range falls back to the full file");
+
+$resp = http_headers("files/${OBJID}", "Range: bytes=a-b");
+is($resp->{status}, 200,                                          "Malformed range falls back to the full file");
+
+$resp = http_headers("files/${OBJID}", "Range: bytes=\xb2-");
+is($resp->{status}, 200,                                          "Non-ASCII digits fall back to the full file");
+
+$resp = http_headers("files/${OBJID}", "Accept-Encoding: gzip");
+is($resp->{"content-encoding"}, "gzip",                           "Full download is gzipped on request");
+ok(!exists $resp->{"accept-ranges"},                              "Gzipped download doesn't advertise byte ranges");
+like($resp->{etag}, qr{^W/"},                                     "Gzipped download has a weak ETag");
+cmp_ok($resp->{"content-length"}, "<", $SIZE,                     "Gzipped download is sent precompressed");
+ok(system("curl -s --compressed '${HOST_PATH}/files/${OBJID}' | cmp -s - examples/${OBJID}") == 0,
+                                                                  "Gzipped download decodes to the file");
+
+$resp = http_headers("files/exampleszip.zip", "Accept-Encoding: gzip");
+is($resp->{"content-encoding"}, "gzip",                           "Zip download is gzipped on request");
@@ -4,7 +4,7 @@ package Support;
 require Exporter;
 @ISA = qw(Exporter);
 our @EXPORT = qw($verbose $no_download $dry_run $HOST_PATH $EMAIL $GROUPID $APIKEY $dl_taskid $analysis_taskid 
-		 cleanup_out f cmd generalize_output rawf dl_poll json_struct);
+		 cleanup_out f cmd http_headers generalize_output rawf dl_poll json_struct);
 
 use Cpanel::JSON::XS;
 use Switch;
@@ -69,6 +69,27 @@ sub cmd {
     }
 }
 
+sub http_headers {
+    # GET an endpoint with extra request headers, returning the status code and
+    # the response headers (names lowercased) instead of the body
+    my ($endpoint, @req_headers) = @_;
+    my $hdr_args = join(" ", map { "-H '$_'" } @req_headers);
+    my $cmd = sprintf("curl -s -o /dev/null -D - -X 'GET' '${HOST_PATH}/%s' %s", $endpoint, $hdr_args);
+    my $dch = "";
+    if($dry_run != 0) { $dch="D";}
+    if($verbose == 1) {
+	print("+$dch [http_headers] ${cmd}\n");
+    }
+    my %resp;
+    if($dry_run == 0) {
+	foreach my $line (split(/\r?\n/, `$cmd`)) {
+	    if($line =~ m{^HTTP/\S+\s+(\d+)}) { $resp{status} = $1; }
+	    elsif($line =~ /^([^:]+):\s*(.*)$/) { $resp{lc $1} = $2; }
+	}
+    }
+    return \%resp;
+}
+
 sub generalize_output {
     # remove ephemeral info from meatadata for comparison
     my ($fn, $raw_outfile, $fields_ref) = @_;